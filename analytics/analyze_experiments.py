@@ -15,19 +15,66 @@ Usage:
     python analyze_experiments.py --funnel --experiment checkout-flow-test
 """
 
+import os
 import sqlite3
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # non-interactive backend; skip the GUI probe
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
-import json
+import jinja2
+import orjson
 import argparse
+import functools
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import numba
+except ImportError:  # optional accelerator for very large event tables
+    numba = None
+
+# Above this many (user, event_type) rows the Numba kernel beats the
+# pandas hash-based pivot
+_NUMBA_EVENT_THRESHOLD = 1_000_000
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _accumulate_counts(user_codes, evt_codes, n, n_users, n_event_types):
+        """Sum pre-grouped event counts into a dense (user, event type) array."""
+        out = np.zeros((n_users, n_event_types), dtype=np.int64)
+        for i in range(user_codes.size):
+            out[user_codes[i], evt_codes[i]] += n[i]
+        return out
+
+_TEMPLATE_ENV = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates')),
+    autoescape=True
+)
+
+def _report_template():
+    """Fetch the compiled report template (cached by the environment)."""
+    return _TEMPLATE_ENV.get_template('report.html.j2')
+
+@functools.lru_cache(maxsize=32)
+def _z_scores(alpha: float, power: float) -> Tuple[float, float]:
+    """Cached z-scores for a two-sided alpha and a target power."""
+    return stats.norm.ppf(1 - alpha / 2), stats.norm.ppf(power)
+
+_STYLE_APPLIED = False
+
+def _apply_plot_style():
+    """Apply the plotting style once per process, not per figure."""
+    global _STYLE_APPLIED
+    if not _STYLE_APPLIED:
+        plt.style.use('seaborn-v0_8-whitegrid')
+        sns.set_palette("husl")
+        _STYLE_APPLIED = True
+
 class ABTestAnalyzer:
     """
     A/B Testing Analytics and Statistical Analysis
@@ -41,6 +88,9 @@ class ABTestAnalyzer:
         """Initialize analyzer with database connection."""
         self.db_path = db_path
         self.conn = None
+        self._df_cache: Dict[Tuple, pd.DataFrame] = {}
+        # Set to e.g. 200_000 to stream-aggregate experiments larger than RAM
+        self.chunksize: Optional[int] = None
         self.connect_db()
         
     def connect_db(self):
@@ -48,41 +98,153 @@ class ABTestAnalyzer:
         try:
             self.conn = sqlite3.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row  # Enable dict-like access
+
+            # Read-optimized settings: WAL + relaxed sync, 256MB page cache,
+            # in-memory temp tables, and memory-mapped I/O for the big scans
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA cache_size=-262144")
+            self.conn.execute("PRAGMA temp_store=MEMORY")
+            self.conn.execute("PRAGMA mmap_size=268435456")
+
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_ua_exp ON user_assignments(experiment_id, user_id)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_ae_user ON analytics_events(user_id, event_type)"
+            )
+
+            # Analytics only reads; reject accidental writes from here on
+            self.conn.execute("PRAGMA query_only=ON")
             print(f"✅ Connected to database: {self.db_path}")
         except Exception as e:
             print(f"❌ Database connection failed: {e}")
             raise
+
+    def _db_version(self) -> int:
+        """Current data version of the database, for cache invalidation.
+
+        PRAGMA data_version increments whenever another connection commits,
+        including WAL commits that never touch the main file's mtime.
+        """
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
     
     def get_experiment_data(self, experiment_id: str) -> pd.DataFrame:
         """
         Retrieve experiment data with user assignments and conversion events.
-        
+
+        Lets SQLite pre-aggregate event counts per (user, event type), pivots
+        the narrow result to the wide per-user layout in pandas, and batch
+        parses purchase properties with orjson for the revenue column.
+
         Args:
             experiment_id: ID of the experiment to analyze
-            
+
         Returns:
             DataFrame with user assignments and conversion data
         """
+        cache_key = ('experiment_data', experiment_id, self._db_version())
+        if cache_key in self._df_cache:
+            return self._df_cache[cache_key]
+
         query = """
-        SELECT 
+        SELECT
             ua.user_id,
             ua.variant_id,
             ua.assigned_at,
-            COUNT(CASE WHEN ae.event_type = 'purchase' THEN 1 END) as conversions,
-            COUNT(CASE WHEN ae.event_type = 'add_to_cart' THEN 1 END) as add_to_carts,
-            COUNT(CASE WHEN ae.event_type = 'page_view' THEN 1 END) as page_views,
-            MAX(CASE WHEN ae.event_type = 'purchase' 
-                THEN json_extract(ae.properties, '$.totalAmount') END) as revenue
+            ae.event_type,
+            COUNT(ae.event_type) as n
         FROM user_assignments ua
         LEFT JOIN analytics_events ae ON ua.user_id = ae.user_id
         WHERE ua.experiment_id = ?
-        GROUP BY ua.user_id, ua.variant_id
+        GROUP BY ua.user_id, ua.variant_id, ae.event_type
         """
-        
-        df = pd.read_sql_query(query, self.conn, params=(experiment_id,))
-        df['converted'] = df['conversions'] > 0
-        df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce').fillna(0)
-        
+
+        purchase_query = """
+        SELECT user_id, properties FROM analytics_events
+        WHERE event_type = 'purchase'
+          AND user_id IN (SELECT user_id FROM user_assignments WHERE experiment_id = ?)
+        """
+
+        event_columns = {'purchase': 'conversions', 'add_to_cart': 'add_to_carts', 'page_view': 'page_views'}
+
+        if self.chunksize:
+            # Stream the grouped rows and fold each chunk into the running
+            # aggregates, so peak memory stays bounded by the chunk size plus
+            # the per-user output regardless of how large the result set is
+            base_parts = []
+            counts = None
+            for chunk in pd.read_sql_query(query, self.conn, params=(experiment_id,),
+                                           chunksize=self.chunksize):
+                base_parts.append(chunk[['user_id', 'variant_id', 'assigned_at']])
+                g = (chunk.dropna(subset=['event_type'])
+                     .pivot_table(index='user_id', columns='event_type',
+                                  values='n', fill_value=0, aggfunc='sum'))
+                counts = g if counts is None else counts.add(g, fill_value=0)
+            base = pd.concat(base_parts, ignore_index=True).drop_duplicates()
+            if counts is None:
+                counts = pd.DataFrame(index=pd.Index([], name='user_id'))
+
+            revenue = None
+            for chunk in pd.read_sql_query(purchase_query, self.conn, params=(experiment_id,),
+                                           chunksize=self.chunksize):
+                parsed = [orjson.loads(p) for p in chunk['properties'].values]
+                s = pd.Series(
+                    [p.get('totalAmount', 0.0) for p in parsed],
+                    index=chunk['user_id'], dtype='float64'
+                ).groupby(level=0).max()
+                revenue = s if revenue is None else pd.concat([revenue, s]).groupby(level=0).max()
+            if revenue is None:
+                revenue = pd.Series(dtype='float64')
+        else:
+            raw = pd.read_sql_query(query, self.conn, params=(experiment_id,))
+            purchases = pd.read_sql_query(purchase_query, self.conn, params=(experiment_id,))
+
+            # Pivot the narrow (user, event_type, n) result to wide per-user counts
+            events_only = raw.dropna(subset=['event_type'])
+            if numba is not None and len(events_only) > _NUMBA_EVENT_THRESHOLD:
+                # Single compiled accumulation pass over categorical codes; skips
+                # the pandas hash-table build, which dominates at this size
+                user_cat = events_only['user_id'].astype('category')
+                evt_cat = events_only['event_type'].astype('category')
+                accumulated = _accumulate_counts(
+                    user_cat.cat.codes.to_numpy(np.int32),
+                    evt_cat.cat.codes.to_numpy(np.int32),
+                    events_only['n'].to_numpy(np.int64),
+                    len(user_cat.cat.categories),
+                    len(evt_cat.cat.categories)
+                )
+                counts = pd.DataFrame(accumulated, index=user_cat.cat.categories,
+                                      columns=evt_cat.cat.categories)
+            else:
+                counts = events_only.pivot_table(index='user_id', columns='event_type',
+                                                 values='n', fill_value=0, aggfunc='sum')
+            # Batch-parse purchase properties with orjson; one pass covers every
+            # field we may want, not just totalAmount
+            parsed = [orjson.loads(p) for p in purchases['properties'].values]
+            revenue = pd.Series(
+                [p.get('totalAmount', 0.0) for p in parsed],
+                index=purchases['user_id'], dtype='float64'
+            ).groupby(level=0).max()
+
+            # Users without events survive the LEFT JOIN as a single NULL-event row
+            base = raw[['user_id', 'variant_id', 'assigned_at']].drop_duplicates()
+
+        counts = (
+            counts.reindex(columns=list(event_columns), fill_value=0)
+            .rename(columns=event_columns)
+        )
+        df = base.merge(counts, left_on='user_id', right_index=True, how='left')
+        for col in event_columns.values():
+            df[col] = df[col].fillna(0).astype(np.int32)
+        df['revenue'] = df['user_id'].map(revenue).fillna(0.0)
+        df['converted'] = df['conversions'] > 0  # numpy bool, one byte per user
+        # Low-cardinality label column; categorical codes make every later
+        # groupby work on small ints instead of repeated string scans
+        df['variant_id'] = df['variant_id'].astype('category')
+
+        print(f"📦 Loaded {len(df)} users ({df.memory_usage(deep=True).sum() / 1024:.0f} KB)")
+        self._df_cache[cache_key] = df
         return df
     
     def calculate_conversion_rates(self, df: pd.DataFrame) -> Dict[str, Dict]:
@@ -95,42 +257,38 @@ class ABTestAnalyzer:
         Returns:
             Dictionary with conversion statistics by variant
         """
-        results = {}
-        
-        for variant in df['variant_id'].unique():
-            variant_data = df[df['variant_id'] == variant]
-            n = len(variant_data)
-            conversions = variant_data['converted'].sum()
-            
-            if n == 0:
-                continue
-                
-            # Conversion rate calculation
-            conversion_rate = conversions / n
-            
-            # Wilson score interval for confidence bounds
-            z = 1.96  # 95% confidence
-            p = conversion_rate
-            
-            denominator = 1 + (z**2 / n)
-            centre_adjusted_probability = (p + (z**2 / (2 * n))) / denominator
-            adjusted_standard_deviation = np.sqrt(((p * (1 - p)) + (z**2 / (4 * n))) / n) / denominator
-            
-            lower_bound = centre_adjusted_probability - (z * adjusted_standard_deviation)
-            upper_bound = centre_adjusted_probability + (z * adjusted_standard_deviation)
-            
-            results[variant] = {
-                'users': n,
-                'conversions': int(conversions),
-                'conversion_rate': conversion_rate,
-                'ci_lower': max(0, lower_bound),
-                'ci_upper': min(1, upper_bound),
-                'revenue_total': variant_data['revenue'].sum(),
-                'revenue_per_user': variant_data['revenue'].mean(),
-                'add_to_cart_rate': variant_data['add_to_carts'].sum() / n if n > 0 else 0
-            }
-        
-        return results
+        if df.empty:
+            return {}
+
+        # Single vectorized pass over all variants instead of one filter per variant
+        grouped = df.groupby('variant_id', observed=True).agg(
+            users=('converted', 'size'),
+            conversions=('converted', 'sum'),
+            revenue_total=('revenue', 'sum'),
+            revenue_per_user=('revenue', 'mean'),
+            add_to_carts_total=('add_to_carts', 'sum')
+        )
+
+        n = grouped['users'].to_numpy(dtype=np.float64)
+        p = grouped['conversions'].to_numpy(dtype=np.float64) / n
+
+        # Wilson score interval for confidence bounds, in closed form:
+        # half_width = (z / 2n) / (1 + z²/n) * sqrt(4n·p(1-p) + z²)
+        z = 1.96  # 95% confidence
+        z2 = z * z
+
+        two_n = 2 * n
+        denominator = 1 + (z2 / n)
+        centre = (p + (z2 / two_n)) / denominator
+        half_width = (z / two_n) / denominator * np.sqrt(2 * two_n * p * (1 - p) + z2)
+
+        grouped['conversion_rate'] = p
+        grouped['ci_lower'] = np.clip(centre - half_width, 0, 1)
+        grouped['ci_upper'] = np.clip(centre + half_width, 0, 1)
+        grouped['add_to_cart_rate'] = grouped['add_to_carts_total'] / n
+        grouped = grouped.drop(columns='add_to_carts_total')
+
+        return grouped.to_dict(orient='index')
     
     def statistical_significance_test(self, df: pd.DataFrame, control_variant: str = 'control') -> Dict:
         """
@@ -143,84 +301,89 @@ class ABTestAnalyzer:
         Returns:
             Dictionary with statistical test results
         """
-        results = {}
-        control_data = df[df['variant_id'] == control_variant]
-        
-        if len(control_data) == 0:
+        grouped = df.groupby('variant_id', observed=True).agg(
+            users=('converted', 'size'),
+            conversions=('converted', 'sum')
+        )
+
+        if control_variant not in grouped.index:
             return {'error': 'Control variant not found'}
-        
-        control_conversions = control_data['converted'].sum()
-        control_users = len(control_data)
-        
-        for variant in df['variant_id'].unique():
-            if variant == control_variant:
-                continue
-                
-            variant_data = df[df['variant_id'] == variant]
-            variant_conversions = variant_data['converted'].sum()
-            variant_users = len(variant_data)
-            
-            # Chi-square test for conversion rates
-            contingency_table = np.array([
-                [control_conversions, control_users - control_conversions],
-                [variant_conversions, variant_users - variant_conversions]
-            ])
-            
-            chi2, p_value, dof, expected = stats.chi2_contingency(contingency_table)
-            
-            # Effect size (Cramér's V)
-            n = contingency_table.sum()
-            cramers_v = np.sqrt(chi2 / (n * (min(contingency_table.shape) - 1)))
-            
-            # Relative lift calculation
-            control_rate = control_conversions / control_users if control_users > 0 else 0
-            variant_rate = variant_conversions / variant_users if variant_users > 0 else 0
-            relative_lift = (variant_rate - control_rate) / control_rate * 100 if control_rate > 0 else 0
-            
-            results[f'{control_variant}_vs_{variant}'] = {
-                'p_value': p_value,
-                'chi_square': chi2,
-                'significant': p_value < 0.05,
-                'effect_size': cramers_v,
-                'relative_lift_percent': relative_lift,
+
+        variants = grouped.index.tolist()
+        converted = grouped['conversions'].to_numpy(dtype=np.float64)
+        not_converted = grouped['users'].to_numpy(dtype=np.float64) - converted
+
+        ctrl_idx = variants.index(control_variant)
+        a, b = converted[ctrl_idx], not_converted[ctrl_idx]
+
+        # Closed-form 2x2 chi-square against the control row, broadcast over
+        # all variants at once: chi² = N(ad-bc)² / ((a+b)(c+d)(a+c)(b+d))
+        n_total = a + b + converted + not_converted
+        marginals = (a + b) * (converted + not_converted) * (a + converted) * (b + not_converted)
+        # A zero marginal (e.g. no conversions in either arm yet) means a
+        # degenerate table: report chi²=0 / p=1 instead of dividing to NaN
+        chi2 = np.divide(
+            n_total * (a * not_converted - b * converted) ** 2, marginals,
+            out=np.zeros_like(marginals), where=marginals > 0
+        )
+        p_values = stats.chi2.sf(chi2, 1)
+
+        # Effect size (Cramér's V); min(shape) - 1 = 1 for a 2x2 table
+        cramers_v = np.sqrt(chi2 / n_total)
+
+        # Relative lift calculation
+        control_rate = a / (a + b) if (a + b) > 0 else 0
+        variant_rates = converted / grouped['users'].to_numpy(dtype=np.float64)
+        relative_lift = (variant_rates - control_rate) / control_rate * 100 if control_rate > 0 else np.zeros_like(variant_rates)
+
+        return {
+            f'{control_variant}_vs_{variant}': {
+                'p_value': p_values[i],
+                'chi_square': chi2[i],
+                'significant': p_values[i] < 0.05,
+                'effect_size': cramers_v[i],
+                'relative_lift_percent': relative_lift[i],
                 'control_rate': control_rate,
-                'variant_rate': variant_rate
+                'variant_rate': variant_rates[i]
             }
-        
-        return results
+            for i, variant in enumerate(variants) if i != ctrl_idx
+        }
     
-    def sample_size_analysis(self, baseline_rate: float, mde: float, alpha: float = 0.05, power: float = 0.8) -> int:
+    def sample_size_analysis(self, baseline_rate, mde, alpha: float = 0.05, power: float = 0.8):
         """
         Calculate required sample size for statistical power.
-        
+
+        Accepts scalars or NumPy arrays for baseline_rate and mde, so a whole
+        planning grid can be evaluated in one broadcast call.
+
         Args:
-            baseline_rate: Expected baseline conversion rate
-            mde: Minimum detectable effect (as proportion)
+            baseline_rate: Expected baseline conversion rate (scalar or array)
+            mde: Minimum detectable effect, as proportion (scalar or array)
             alpha: Type I error rate (significance level)
             power: Statistical power (1 - Type II error rate)
-            
+
         Returns:
-            Required sample size per variant
+            Required sample size per variant; an int for scalar inputs, or an
+            int array shaped like the broadcast of the inputs
         """
         # Z-scores for alpha and power
-        z_alpha = stats.norm.ppf(1 - alpha/2)
-        z_beta = stats.norm.ppf(power)
-        
+        z_alpha, z_beta = _z_scores(alpha, power)
+
         # Effect size calculation
-        p1 = baseline_rate
-        p2 = baseline_rate * (1 + mde)
-        
+        p1 = np.asarray(baseline_rate, dtype=np.float64)
+        p2 = p1 * (1 + np.asarray(mde, dtype=np.float64))
+
         # Pooled proportion
         p_pooled = (p1 + p2) / 2
-        
+
         # Sample size formula for two proportions
-        numerator = (z_alpha * np.sqrt(2 * p_pooled * (1 - p_pooled)) + 
+        numerator = (z_alpha * np.sqrt(2 * p_pooled * (1 - p_pooled)) +
                     z_beta * np.sqrt(p1 * (1 - p1) + p2 * (1 - p2))) ** 2
         denominator = (p2 - p1) ** 2
-        
-        sample_size = int(np.ceil(numerator / denominator))
-        
-        return sample_size
+
+        sample_size = np.ceil(numerator / denominator).astype(np.int64)
+
+        return int(sample_size) if sample_size.ndim == 0 else sample_size
     
     def funnel_analysis(self, experiment_id: str) -> pd.DataFrame:
         """
@@ -232,8 +395,12 @@ class ABTestAnalyzer:
         Returns:
             DataFrame with funnel step analysis by variant
         """
+        cache_key = ('funnel', experiment_id, self._db_version())
+        if cache_key in self._df_cache:
+            return self._df_cache[cache_key]
+
         query = """
-        SELECT 
+        SELECT
             ua.variant_id,
             ae.event_type,
             COUNT(DISTINCT ae.user_id) as unique_users,
@@ -244,68 +411,64 @@ class ABTestAnalyzer:
         GROUP BY ua.variant_id, ae.event_type
         ORDER BY ua.variant_id, ae.event_type
         """
-        
-        return pd.read_sql_query(query, self.conn, params=(experiment_id,))
+
+        funnel_df = pd.read_sql_query(query, self.conn, params=(experiment_id,))
+        self._df_cache[cache_key] = funnel_df
+        return funnel_df
     
-    def generate_visualizations(self, experiment_id: str, output_dir: str = 'reports'):
+    def generate_visualizations(self, experiment_id: str, output_dir: str = 'reports', dpi: int = 150,
+                                df: pd.DataFrame = None, conversion_stats: Dict[str, Dict] = None):
         """
         Generate comprehensive visualizations for experiment analysis.
-        
+
         Args:
             experiment_id: ID of the experiment to visualize
             output_dir: Directory to save visualization files
+            dpi: Resolution of the saved figure
+            df: Pre-loaded experiment data, to skip the query if available
+            conversion_stats: Pre-computed variant statistics, if available
         """
-        import os
         os.makedirs(output_dir, exist_ok=True)
-        
+
         # Set up the plotting style
-        plt.style.use('seaborn-v0_8-whitegrid')
-        sns.set_palette("husl")
-        
-        # Get experiment data
-        df = self.get_experiment_data(experiment_id)
-        conversion_stats = self.calculate_conversion_rates(df)
+        _apply_plot_style()
+
+        # Get experiment data unless the caller already has it
+        if df is None:
+            df = self.get_experiment_data(experiment_id)
+        if conversion_stats is None:
+            conversion_stats = self.calculate_conversion_rates(df)
         
-        # 1. Conversion Rate Comparison
         fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 12))
-        
-        variants = list(conversion_stats.keys())
-        rates = [conversion_stats[v]['conversion_rate'] for v in variants]
-        ci_lower = [conversion_stats[v]['ci_lower'] for v in variants]
-        ci_upper = [conversion_stats[v]['ci_upper'] for v in variants]
-        
-        # Conversion rates with confidence intervals
-        bars = ax1.bar(variants, rates, alpha=0.7, color=['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728'][:len(variants)])
-        ax1.errorbar(variants, rates, 
-                    yerr=[(np.array(rates) - np.array(ci_lower)), 
-                          (np.array(ci_upper) - np.array(rates))], 
+
+        # All per-variant series in one frame; colors computed once
+        stats_df = pd.DataFrame(conversion_stats).T
+        variants = stats_df.index.tolist()
+        colors = sns.color_palette('husl', n_colors=len(variants))
+
+        # 1. Conversion rates with confidence intervals
+        rates = stats_df['conversion_rate'].to_numpy()
+        bars = ax1.bar(variants, rates, alpha=0.7, color=colors)
+        ax1.errorbar(variants, rates,
+                    yerr=[rates - stats_df['ci_lower'].to_numpy(),
+                          stats_df['ci_upper'].to_numpy() - rates],
                     fmt='none', ecolor='black', capsize=5)
         ax1.set_title(f'Conversion Rates by Variant\\n{experiment_id}', fontsize=14, fontweight='bold')
         ax1.set_ylabel('Conversion Rate')
-        ax1.set_ylim(0, max(ci_upper) * 1.2)
-        
-        # Add value labels on bars
-        for bar, rate in zip(bars, rates):
-            height = bar.get_height()
-            ax1.text(bar.get_x() + bar.get_width()/2., height + max(rates) * 0.01,
-                    f'{rate:.2%}', ha='center', va='bottom')
-        
+        ax1.set_ylim(0, stats_df['ci_upper'].max() * 1.2)
+        ax1.bar_label(bars, labels=[f'{r:.2%}' for r in rates], padding=3)
+
         # 2. Sample size distribution
-        users = [conversion_stats[v]['users'] for v in variants]
-        ax2.bar(variants, users, alpha=0.7, color=['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728'][:len(variants)])
+        bars = ax2.bar(variants, stats_df['users'], alpha=0.7, color=colors)
         ax2.set_title('Sample Size by Variant', fontsize=14, fontweight='bold')
         ax2.set_ylabel('Number of Users')
-        
-        for i, (variant, user_count) in enumerate(zip(variants, users)):
-            ax2.text(i, user_count + max(users) * 0.01, str(user_count), 
-                    ha='center', va='bottom')
-        
+        ax2.bar_label(bars, fmt='%d', padding=3)
+
         # 3. Revenue analysis
-        revenue_per_user = [conversion_stats[v]['revenue_per_user'] for v in variants]
-        ax3.bar(variants, revenue_per_user, alpha=0.7, color=['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728'][:len(variants)])
+        ax3.bar(variants, stats_df['revenue_per_user'], alpha=0.7, color=colors)
         ax3.set_title('Revenue per User', fontsize=14, fontweight='bold')
         ax3.set_ylabel('Revenue (€)')
-        
+
         # 4. Funnel analysis
         funnel_df = self.funnel_analysis(experiment_id)
         if not funnel_df.empty:
@@ -316,131 +479,49 @@ class ABTestAnalyzer:
             ax4.legend(title='Variant')
             ax4.tick_params(axis='x', rotation=45)
         
-        plt.tight_layout()
-        plt.savefig(f'{output_dir}/{experiment_id}_analysis.png', dpi=300, bbox_inches='tight')
+        fig.tight_layout()
+        fig.savefig(f'{output_dir}/{experiment_id}_analysis.png', dpi=dpi,
+                    bbox_inches='tight', metadata={'Software': ''})
+        plt.close(fig)  # free the figure so batched report runs don't accumulate
         print(f"📊 Visualizations saved: {output_dir}/{experiment_id}_analysis.png")
         
         return fig
     
-    def generate_report(self, experiment_id: str, output_file: str = None):
+    def generate_report(self, experiment_id: str, output_file: str = None, df: pd.DataFrame = None,
+                        conversion_stats: Dict[str, Dict] = None):
         """
         Generate comprehensive HTML report for experiment analysis.
-        
+
         Args:
             experiment_id: ID of the experiment to report on
             output_file: Output filename for the report
+            df: Pre-loaded experiment data, to skip the query if available
+            conversion_stats: Pre-computed variant statistics, if available
         """
         if output_file is None:
             output_file = f'reports/{experiment_id}_report.html'
-        
-        # Get analysis data
-        df = self.get_experiment_data(experiment_id)
-        conversion_stats = self.calculate_conversion_rates(df)
+
+        # Get analysis data unless the caller already has it
+        if df is None:
+            df = self.get_experiment_data(experiment_id)
+        if conversion_stats is None:
+            conversion_stats = self.calculate_conversion_rates(df)
         significance_tests = self.statistical_significance_test(df)
         
-        # Generate HTML report
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>A/B Test Report: {experiment_id}</title>
-            <style>
-                body {{ font-family: 'Segoe UI', Arial, sans-serif; margin: 40px; background: #f5f5f5; }}
-                .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 40px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                .header {{ text-align: center; margin-bottom: 40px; border-bottom: 2px solid #007acc; padding-bottom: 20px; }}
-                .metric-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 20px; margin: 30px 0; }}
-                .metric-card {{ background: #f8f9fa; border: 1px solid #e9ecef; border-radius: 6px; padding: 20px; text-align: center; }}
-                .metric-value {{ font-size: 2em; font-weight: bold; color: #007acc; }}
-                .metric-label {{ color: #666; margin-top: 5px; }}
-                .significance {{ background: #d4edda; border: 1px solid #c3e6cb; color: #155724; }}
-                .not-significant {{ background: #f8d7da; border: 1px solid #f5c6cb; color: #721c24; }}
-                table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-                th, td {{ border: 1px solid #ddd; padding: 12px; text-align: left; }}
-                th {{ background-color: #007acc; color: white; }}
-                .highlight {{ background-color: #fff3cd; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>A/B Test Analysis Report</h1>
-                    <h2>{experiment_id}</h2>
-                    <p>Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                </div>
-                
-                <h2>📊 Summary Statistics</h2>
-                <div class="metric-grid">
-        """
-        
-        # Add variant statistics
-        for variant, stats in conversion_stats.items():
-            html_content += f"""
-                    <div class="metric-card">
-                        <div class="metric-value">{stats['conversion_rate']:.2%}</div>
-                        <div class="metric-label">{variant} Conversion Rate</div>
-                        <small>{stats['conversions']} / {stats['users']} users</small>
-                    </div>
-            """
-        
-        html_content += """
-                </div>
-                
-                <h2>🔬 Statistical Significance Tests</h2>
-                <table>
-                    <tr>
-                        <th>Comparison</th>
-                        <th>P-Value</th>
-                        <th>Significant?</th>
-                        <th>Relative Lift</th>
-                        <th>Effect Size</th>
-                    </tr>
-        """
-        
-        # Add significance test results
-        for comparison, test_result in significance_tests.items():
-            significance_class = 'significance' if test_result['significant'] else 'not-significant'
-            html_content += f"""
-                    <tr class="{significance_class}">
-                        <td>{comparison}</td>
-                        <td>{test_result['p_value']:.4f}</td>
-                        <td>{'✅ Yes' if test_result['significant'] else '❌ No'}</td>
-                        <td>{test_result['relative_lift_percent']:.1f}%</td>
-                        <td>{test_result['effect_size']:.3f}</td>
-                    </tr>
-            """
-        
-        html_content += f"""
-                </table>
-                
-                <h2>📈 Recommendations</h2>
-                <div style="background: #e7f3ff; border-left: 4px solid #007acc; padding: 20px; margin: 20px 0;">
-        """
-        
-        # Generate recommendations based on results
-        if significance_tests:
+        # Render through the precompiled, auto-escaping template
+        best_variant = None
+        if conversion_stats:
             best_variant = max(conversion_stats.items(), key=lambda x: x[1]['conversion_rate'])
-            html_content += f"""
-                    <h3>Key Findings:</h3>
-                    <ul>
-                        <li><strong>Best Performing Variant:</strong> {best_variant[0]} with {best_variant[1]['conversion_rate']:.2%} conversion rate</li>
-                        <li><strong>Sample Size:</strong> Total of {df['user_id'].nunique()} users across all variants</li>
-                        <li><strong>Statistical Power:</strong> {'Sufficient' if df['user_id'].nunique() > 1000 else 'May need more data'}</li>
-                    </ul>
-            """
-        
-        html_content += """
-                </div>
-                
-                <footer style="margin-top: 40px; text-align: center; color: #666; border-top: 1px solid #eee; padding-top: 20px;">
-                    <p>Generated by AB Testing Analytics Suite | Vue 3 + TypeScript Demo Project</p>
-                </footer>
-            </div>
-        </body>
-        </html>
-        """
-        
+
+        html_content = _report_template().render(
+            experiment_id=experiment_id,
+            generated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            conversion_stats=conversion_stats,
+            significance_tests=significance_tests,
+            best_variant=best_variant,
+            total_users=len(df)  # one row per assigned user after the pivot
+        )
+
         # Save report
         import os
         os.makedirs(os.path.dirname(output_file) if os.path.dirname(output_file) else 'reports', exist_ok=True)
@@ -503,12 +584,14 @@ def main():
         # Generate report if requested
         if args.report:
             output_file = args.output or f"reports/{args.experiment}_report.html"
-            analyzer.generate_report(args.experiment, output_file)
+            analyzer.generate_report(args.experiment, output_file, df=df,
+                                     conversion_stats=conversion_stats)
         
         # Generate visualizations if requested
         if args.visualize:
             output_dir = args.output or "reports"
-            analyzer.generate_visualizations(args.experiment, output_dir)
+            analyzer.generate_visualizations(args.experiment, output_dir, df=df,
+                                             conversion_stats=conversion_stats)
         
         # Funnel analysis if requested
         if args.funnel: